@@ -1,128 +1,557 @@
-from fastapi import FastAPI, HTTPException, status, Path, Query
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, status, Body, Path, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field
+import aiosqlite
+import asyncio
+import logging
+import orjson
 import sqlite3
-from typing import Optional
+import threading
+import time
+import unicodedata
+from contextlib import asynccontextmanager, contextmanager
+from typing import List, Optional
 from datetime import datetime, timedelta
 
-app = FastAPI(
-    title="Dental Clinic API",
-    description="Voice Agent Appointment Booking",
-    version="3.0"
-)
-
 DB_NAME = "clinic.db"
 WORK_START = 8
 WORK_END = 16
 APPOINTMENT_DURATION = 60
+DATE_FORMAT = "%Y-%m-%d %H:%M"
+AVAILABILITY_TTL = 30  # seconds
+AVAILABILITY_CACHE_SIZE = 512  # days
+STREAM_BATCH = 256  # rows per chunk when streaming the full listing
+
+log = logging.getLogger("clinic")
+
+# RAISE messages of the booking-rule triggers.
+PAST_DATE = "past_date"
+OUTSIDE_WORK_HOURS = "outside_work_hours"
 
 # ---------- Database ----------
-def get_db():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
+# One writer connection plus a small pool of aiosqlite reader connections per
+# worker, opened in the lifespan handler. Under WAL readers never block the
+# writer. Writes run in a worker thread via asyncio.to_thread and go through
+# WRITE_LOCK since a connection is not safe for concurrent use.
+READ_POOL_SIZE = 4
+
+# Per-connection settings; journal_mode is persisted by init_db.
+PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",  # 64 MiB
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA foreign_keys=ON",
+)
+
+WRITER: Optional[sqlite3.Connection] = None
+WRITE_LOCK = threading.Lock()
+READERS: "Optional[asyncio.Queue[aiosqlite.Connection]]" = None
+# Only ever reads PRAGMA data_version, which changes whenever any other
+# connection (this worker's writer or another worker's) commits.
+WATCHER: Optional[sqlite3.Connection] = None
+
+def connect():
+    conn = sqlite3.connect(
+        DB_NAME, check_same_thread=False, isolation_level=None, cached_statements=256
+    )
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+async def connect_reader():
+    conn = await aiosqlite.connect(DB_NAME, isolation_level=None, cached_statements=256)
+    for pragma in PRAGMAS:
+        await conn.execute(pragma)
     return conn
 
-def init_db():
-    conn = get_db()
+def fold_name(name: str) -> str:
+    # unicode61's remove_diacritics leaves Arabic harakat in place (they split
+    # tokens instead), so strip every combining mark before indexing and
+    # before matching.
+    return "".join(
+        c for c in unicodedata.normalize("NFD", name)
+        if unicodedata.category(c) != "Mn"
+    )
+
+@asynccontextmanager
+async def reader():
+    conn = await READERS.get()
+    try:
+        yield conn
+    finally:
+        READERS.put_nowait(conn)
+
+@contextmanager
+def writer():
+    with WRITE_LOCK:
+        yield WRITER
+
+@contextmanager
+def transaction(conn):
+    # Take the write lock up front: upgrading a deferred transaction from
+    # read to write can fail with SQLITE_BUSY under concurrent writers
+    # instead of waiting. Single-statement writes run in autocommit and
+    # already lock when the statement starts, so they skip this.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+def init_db(conn):
+    conn.execute("PRAGMA journal_mode=WAL")
+    with transaction(conn):
+        legacy_rows = take_legacy_rows(conn)
+        create_tables(conn)
+        # Legacy rows go in before the booking rules exist, since many of
+        # them are in the past by now.
+        conn.executemany(SQL_MIGRATE_APPT, legacy_rows)
+        sync_name_index(conn)
+        create_booking_rules(conn)
+
+def take_legacy_rows(conn):
+    # Databases created before appointment_date became INTEGER epoch seconds
+    # hold it as TEXT "YYYY-MM-DD HH:MM". Read those rows out converted and
+    # drop the old table (its indexes and triggers go with it) so the
+    # current schema can be built in its place.
+    # The old schema allowed any minute and did not stop two bookings landing
+    # in the same hour, while the new one holds one booking per slot start.
+    # Each row is moved to the start of its hour; a row whose slot is already
+    # held by an earlier id is kept as-is in appointments_unmigrated for the
+    # clinic to rebook by hand.
+    column = conn.execute(
+        "SELECT type FROM pragma_table_info('appointments') WHERE name = 'appointment_date'"
+    ).fetchone()
+    if not column or column[0].upper() != "TEXT":
+        return []
+
+    rows = conn.execute(
+        "SELECT id, patient_name, age, service, appointment_date FROM appointments ORDER BY id"
+    ).fetchall()
+    conn.execute("DROP TABLE appointments")
+
+    migrated, moved, unmigrated, taken = [], [], [], set()
+    for row in rows:
+        id_, patient_name, age, service, date = row
+        requested = datetime.strptime(date, DATE_FORMAT)
+        slot = to_epoch(requested.replace(minute=0))
+        if slot in taken:
+            unmigrated.append(row)
+            continue
+        taken.add(slot)
+        if requested.minute:
+            moved.append(id_)
+        migrated.append((id_, patient_name, age, service, slot))
+
+    if moved:
+        log.warning("Moved legacy appointments %s to the start of their hour", moved)
+    if unmigrated:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS appointments_unmigrated (
+                id INTEGER PRIMARY KEY,
+                patient_name TEXT NOT NULL,
+                age INTEGER NOT NULL,
+                service TEXT NOT NULL,
+                appointment_date TEXT NOT NULL
+            )
+        """)
+        conn.executemany(
+            "INSERT INTO appointments_unmigrated VALUES (?, ?, ?, ?, ?)", unmigrated
+        )
+        log.warning(
+            "Legacy appointments %s share a slot with an earlier booking; "
+            "kept in appointments_unmigrated",
+            [row[0] for row in unmigrated],
+        )
+    return migrated
+
+def create_tables(conn):
     conn.execute("""
         CREATE TABLE IF NOT EXISTS appointments (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             patient_name TEXT NOT NULL,
             age INTEGER NOT NULL,
             service TEXT NOT NULL,
-            appointment_date TEXT NOT NULL
+            appointment_date INTEGER NOT NULL UNIQUE  -- unix epoch seconds, slot start
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_appt_age ON appointments(age)")
+
+    # Token index over folded patient names. fold_name is Python, so the
+    # index is written by the app's own insert/delete paths rather than by
+    # triggers, which would then fail on any connection (sqlite3 shell,
+    # another script) that has not registered it.
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS appointments_fts USING fts5(
+            patient_name, tokenize='unicode61 remove_diacritics 2'
         )
     """)
-    conn.commit()
-    conn.close()
 
-init_db()
+def sync_name_index(conn):
+    # Rows written or deleted by other tools since the last start (and rows
+    # from before appointments_fts existed) are caught up here; until then
+    # the name search does not see them.
+    conn.execute(SQL_UNINDEX_DELETED_NAMES)
+    missing = conn.execute(SQL_UNINDEXED_NAMES).fetchall()
+    conn.executemany(SQL_INDEX_NAME, [(id_, fold_name(name)) for id_, name in missing])
+
+def create_booking_rules(conn):
+    # Booking rules, enforced by the same INSERT/UPDATE that books the slot.
+    # new.appointment_date is exactly the requested start time (nothing is
+    # rounded), so the past check sees what the client asked for.
+    # CHECK constraints may not read the clock or the local timezone, so these
+    # are BEFORE triggers; RAISE surfaces as sqlite3.IntegrityError.
+    # The working hours are written into the trigger body, so the triggers
+    # are rebuilt on every start to pick up a change to WORK_START/WORK_END.
+    for name, event in (("insert", "INSERT"), ("update", "UPDATE OF appointment_date")):
+        conn.execute(f"DROP TRIGGER IF EXISTS appointments_rules_{name}")
+        conn.execute(f"""
+            CREATE TRIGGER appointments_rules_{name} BEFORE {event} ON appointments BEGIN
+                SELECT RAISE(ABORT, '{PAST_DATE}')
+                WHERE new.appointment_date < CAST(strftime('%s', 'now') AS INTEGER);
+                SELECT RAISE(ABORT, '{OUTSIDE_WORK_HOURS}')
+                WHERE CAST(strftime('%H', new.appointment_date, 'unixepoch', 'localtime') AS INTEGER)
+                    NOT BETWEEN {WORK_START} AND {WORK_END - 1};
+            END
+        """)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global WRITER, READERS, WATCHER
+    WRITER = connect()
+    init_db(WRITER)
+    WATCHER = connect()
+    READERS = asyncio.Queue()
+    for _ in range(READ_POOL_SIZE):
+        READERS.put_nowait(await connect_reader())
+    yield
+    while not READERS.empty():
+        await READERS.get_nowait().close()
+    READERS = None
+    WATCHER.close()
+    WATCHER = None
+    WRITER.close()
+    WRITER = None
+
+app = FastAPI(
+    title="Dental Clinic API",
+    description="Voice Agent Appointment Booking",
+    version="3.0",
+    lifespan=lifespan
+)
+
+# ---------- SQL ----------
+# Every statement is a module constant so each connection's statement cache
+# sees the same few strings and never re-prepares them.
+# Rows come back as plain tuples in the order of the matching *_KEYS.
+APPT_KEYS = ("id", "patient_name", "age", "service", "appointment_date")
+FOUND_APPT_KEYS = ("id", "appointment_date", "service")
+
+# Pages of the full listing; appointment_date is UNIQUE, so it is the key
+# for the next page.
+SQL_ALL_APPTS = """
+    SELECT id, patient_name, age, service, appointment_date
+    FROM appointments ORDER BY appointment_date LIMIT ?
+"""
+SQL_ALL_APPTS_AFTER = """
+    SELECT id, patient_name, age, service, appointment_date
+    FROM appointments WHERE appointment_date > ? ORDER BY appointment_date LIMIT ?
+"""
+
+SQL_GET_APPT = """
+    SELECT id, patient_name, age, service, appointment_date
+    FROM appointments WHERE id = ?
+"""
+
+# Working hours with no booking starting inside them, in one round-trip.
+# The range on appointment_date keeps it on the UNIQUE index; the hour is
+# read in local time, as the booking-rule triggers do, since days with a DST
+# change are not 24 hours long.
+SQL_FREE_SLOTS = """
+    WITH RECURSIVE hours(h) AS (
+        SELECT :work_start
+        UNION ALL
+        SELECT h + 1 FROM hours WHERE h + 1 < :work_end
+    )
+    SELECT printf('%02d:00', h) FROM hours
+    WHERE NOT EXISTS (
+        SELECT 1 FROM appointments
+        WHERE appointment_date >= :day_start
+          AND appointment_date < :day_end
+          AND CAST(strftime('%H', appointment_date, 'unixepoch', 'localtime') AS INTEGER) = h
+    )
+    ORDER BY h
+"""
+
+SQL_INSERT_APPTS = """
+    INSERT INTO appointments (patient_name, age, service, appointment_date)
+    VALUES (?, ?, ?, ?)
+"""
+SQL_INSERT_APPT = SQL_INSERT_APPTS + "RETURNING id"
+
+# Keeps the original ids when carrying legacy rows over.
+SQL_MIGRATE_APPT = """
+    INSERT INTO appointments (id, patient_name, age, service, appointment_date)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+# Name index rows, written in the same transaction as the appointment.
+SQL_INDEX_NAME = "INSERT INTO appointments_fts (rowid, patient_name) VALUES (?, ?)"
+SQL_INDEX_BOOKED_NAME = """
+    INSERT INTO appointments_fts (rowid, patient_name)
+    SELECT id, ? FROM appointments WHERE appointment_date = ?
+"""
+SQL_UNINDEX_NAME = "DELETE FROM appointments_fts WHERE rowid = ?"
+SQL_UNINDEXED_NAMES = """
+    SELECT id, patient_name FROM appointments
+    WHERE id NOT IN (SELECT rowid FROM appointments_fts)
+"""
+SQL_UNINDEX_DELETED_NAMES = """
+    DELETE FROM appointments_fts
+    WHERE rowid NOT IN (SELECT id FROM appointments)
+"""
+
+SQL_RESCHEDULE_APPT = "UPDATE appointments SET appointment_date = ? WHERE id = ? RETURNING id"
+
+SQL_DELETE_APPT = "DELETE FROM appointments WHERE id = ? RETURNING id"
+
+_FIND_APPTS = "SELECT a.id, a.appointment_date, a.service FROM appointments a"
+_BY_NAME = """
+    JOIN appointments_fts f ON f.rowid = a.id
+    WHERE appointments_fts MATCH ?
+"""
+_ORDER = " ORDER BY a.appointment_date"
+SQL_FIND_APPTS = _FIND_APPTS + _ORDER
+SQL_FIND_APPTS_BY_AGE = _FIND_APPTS + " WHERE a.age = ?" + _ORDER
+SQL_FIND_APPTS_BY_NAME = _FIND_APPTS + _BY_NAME + _ORDER
+SQL_FIND_APPTS_BY_NAME_AGE = _FIND_APPTS + _BY_NAME + " AND a.age = ?" + _ORDER
 
 # ---------- Models ----------
+# Shared by every request body. Strings are stored stripped of surrounding
+# whitespace, and oversized ones are rejected before reaching the DB.
+MODEL_CONFIG = ConfigDict(
+    str_strip_whitespace=True,
+    str_max_length=200
+)
+
 class AppointmentCreate(BaseModel):
-    patient_name: str
+    model_config = MODEL_CONFIG
+
+    patient_name: str = Field(min_length=2, max_length=100)
     age: int
     service: str
     appointment_date: str
 
 class AppointmentUpdate(BaseModel):
+    model_config = MODEL_CONFIG
+
+    appointment_date: str
+
+# Response models: with one declared, FastAPI serializes the returned dict
+# straight to JSON bytes through pydantic-core instead of jsonable_encoder.
+class Appointment(BaseModel):
+    id: int
+    patient_name: str
+    age: int
+    service: str
+    appointment_date: str
+
+class FoundAppointment(BaseModel):
+    id: int
     appointment_date: str
+    service: str
+
+class AppointmentList(BaseModel):
+    count: int
+    appointments: List[FoundAppointment]
+
+class Availability(BaseModel):
+    date: str
+    available_slots: List[str]
+
+class Booking(BaseModel):
+    status: str
+    id: int
+    appointment_date: str
+
+class BulkBooking(BaseModel):
+    status: str
+    count: int
+    appointment_dates: List[str]
+
+class Rescheduled(BaseModel):
+    status: str
+    new_date: str
+
+class Cancelled(BaseModel):
+    status: str
 
 # ---------- Helpers ----------
+def parse_canonical_date(date_str: str):
+    # Fast path for YYYY-MM-DDTHH:MM:SSZ, which is what most clients send.
+    if (
+        len(date_str) != 20
+        or date_str[4] != "-" or date_str[7] != "-" or date_str[10] != "T"
+        or date_str[13] != ":" or date_str[16] != ":" or date_str[19] != "Z"
+    ):
+        return None
+    try:
+        return datetime(
+            int(date_str[0:4]), int(date_str[5:7]), int(date_str[8:10]),
+            int(date_str[11:13]), int(date_str[14:16]), int(date_str[17:19])
+        )
+    except ValueError:
+        return None
+
 def parse_and_validate_date(date_str: str):
     formats = [
-        "%Y-%m-%dT%H:%M:%SZ",      # ISO format (2025-12-30T15:00:00Z)
+        "%Y-%m-%dT%H:%M:%S",       # ISO format (2025-12-30T15:00:00Z)
         "%Y-%m-%d %H:%M:%S",       # SQL format (2025-12-30 15:00:00)
         "%d/%m/%Y %H:%M:%S",       # Slash format (30/12/2025 15:00:00)
         "%Y-%m-%d %H:%M"           # Short format
     ]
-    
-    dt_obj = None
-    for fmt in formats:
-        try:
-            dt_obj = datetime.strptime(date_str.replace("Z", ""), fmt)
-            break
-        except ValueError:
-            continue
-            
-    if not dt_obj:
-        raise HTTPException(status_code=400, detail="صيغة التاريخ غير مفهومة، يرجى استخدام YYYY-MM-DD HH:MM")
-
-    if dt_obj < datetime.now():
-         raise HTTPException(status_code=400, detail=f"لا يمكن حجز موعد في الماضي! تاريخ اليوم هو {datetime.now().strftime('%Y-%m-%d')}")
-
-    return dt_obj.strftime("%Y-%m-%d %H:%M") 
 
-def check_availability(conn, target_dt: datetime, exclude_id: int = None):
-    start = (target_dt - timedelta(minutes=59)).strftime("%Y-%m-%d %H:%M")
-    end = (target_dt + timedelta(minutes=59)).strftime("%Y-%m-%d %H:%M")
-
-    query = """
-        SELECT id FROM appointments
-        WHERE appointment_date > ? AND appointment_date < ?
-    """
-    params = [start, end]
+    dt_obj = parse_canonical_date(date_str)
+    if not dt_obj:
+        for fmt in formats:
+            try:
+                dt_obj = datetime.strptime(date_str.replace("Z", ""), fmt)
+                break
+            except ValueError:
+                continue
 
-    if exclude_id:
-        query += " AND id != ?"
-        params.append(exclude_id)
+    if not dt_obj:
+        raise HTTPException(status_code=400, detail="صيغة التاريخ غير مفهومة، يرجى استخدام YYYY-MM-DD HH:MM")
 
-    cursor = conn.execute(query, params)
-    return cursor.fetchone() is None
+    # Appointments occupy whole one-hour slots, the same ones /availability
+    # lists, so a slot can only be booked once (UNIQUE appointment_date).
+    # Off-the-hour times are rejected rather than moved, so the time booked is
+    # always the time asked for.
+    if dt_obj.minute or dt_obj.second:
+        raise HTTPException(status_code=400, detail="المواعيد تبدأ على رأس الساعة فقط، مثل 10:00")
+
+    return dt_obj
+
+def booking_error(error: sqlite3.IntegrityError, conflict_detail: str) -> HTTPException:
+    # Map a failed booking INSERT/UPDATE to the right HTTP error.
+    if error.sqlite_errorcode == sqlite3.SQLITE_CONSTRAINT_TRIGGER:
+        if str(error) == PAST_DATE:
+            return HTTPException(400, f"لا يمكن حجز موعد في الماضي! تاريخ اليوم هو {datetime.now().strftime('%Y-%m-%d')}")
+        if str(error) == OUTSIDE_WORK_HOURS:
+            return HTTPException(400, "خارج ساعات الدوام")
+    return HTTPException(409, conflict_detail)
+
+# appointment_date is stored as INTEGER epoch seconds; these convert at the
+# API boundary so responses keep the YYYY-MM-DD HH:MM format.
+def to_epoch(dt: datetime) -> int:
+    return int(dt.timestamp())
+
+def format_date(ts: int) -> str:
+    return datetime.fromtimestamp(ts).strftime(DATE_FORMAT)
+
+def appointment_row(row: tuple, keys: tuple = APPT_KEYS) -> dict:
+    appointment = dict(zip(keys, row))
+    appointment["appointment_date"] = format_date(appointment["appointment_date"])
+    return appointment
+
+def name_query(name: str) -> str:
+    # Every word of the name as a quoted prefix term, e.g. "ahm"* "ali"*
+    terms = fold_name(name).replace('"', '""').split()
+    return " ".join(f'"{term}"*' for term in terms) or '""'
+
+# Free slots per day (YYYY-MM-DD -> (slots, data_version, expiry)). An entry
+# is only served while the database's data_version still matches, so a
+# commit from any worker invalidates it immediately.
+AVAILABILITY_CACHE: dict[str, tuple[list[str], int, float]] = {}
+
+def data_version() -> int:
+    return WATCHER.execute("PRAGMA data_version").fetchone()[0]
+
+def cache_availability(key: str, slots: list[str], version: int):
+    # The key comes from the client, so entries that can no longer be served
+    # are dropped on every store, and past AVAILABILITY_CACHE_SIZE the oldest
+    # one goes (dicts keep insertion order).
+    now = time.monotonic()
+    stale = [
+        k for k, (_, v, expiry) in AVAILABILITY_CACHE.items()
+        if v != version or expiry <= now
+    ]
+    for k in stale:
+        del AVAILABILITY_CACHE[k]
+    AVAILABILITY_CACHE.pop(key, None)
+    if len(AVAILABILITY_CACHE) >= AVAILABILITY_CACHE_SIZE:
+        del AVAILABILITY_CACHE[next(iter(AVAILABILITY_CACHE))]
+    AVAILABILITY_CACHE[key] = (slots, version, now + AVAILABILITY_TTL)
 
 # ---------- Health ----------
-@app.get("/")
-def get_all_appointments():
-    conn = get_db()
-    rows = conn.execute(
-        "SELECT * FROM appointments ORDER BY appointment_date"
-    ).fetchall()
-    conn.close()
+async def fetch_page(after: Optional[int] = None):
+    # Each page checks a reader out for its own short query only, so a slow
+    # client never holds a pooled connection or a read transaction while the
+    # previous page is still being sent.
+    async with reader() as conn:
+        if after is None:
+            return await conn.execute_fetchall(SQL_ALL_APPTS, (STREAM_BATCH,))
+        return await conn.execute_fetchall(SQL_ALL_APPTS_AFTER, (after, STREAM_BATCH))
+
+def encode_page(rows) -> bytes:
+    return b",".join(orjson.dumps(appointment_row(row)) for row in rows)
 
-    return {
-        "count": len(rows),
-        "appointments": [dict(row) for row in rows]
-    }
+@app.get("/")
+async def get_all_appointments():
+    # Streams the same {"appointments": [...], "count": N} document page by
+    # page; count goes last since it is only known at the end. The first page
+    # is read and encoded before the response starts, so a failing query is
+    # still a 500 rather than an empty 200.
+    rows = await fetch_page()
+    first = encode_page(rows)
+
+    async def body(rows, chunk):
+        count = len(rows)
+        yield b'{"appointments":[' + chunk
+        while len(rows) == STREAM_BATCH:
+            rows = await fetch_page(rows[-1][4])
+            if rows:
+                yield b"," + encode_page(rows)
+                count += len(rows)
+        yield b'],"count":%d}' % count
+
+    return StreamingResponse(body(rows, first), media_type="application/json")
 
 
 # ---------- Availability ----------
-@app.get("/availability")
-def get_availability(date: str = Query(..., description="YYYY-MM-DD")):
-    conn = get_db()
-    cursor = conn.cursor()
-
-    query = "SELECT appointment_date FROM appointments WHERE appointment_date LIKE ?"
-    params = (f"{date}%",)
-    print(f"Query: {query}, Params: {params}")
-
-    cursor.execute(query, params)
-    booked = [datetime.strptime(r[0], "%Y-%m-%d %H:%M").hour for r in cursor.fetchall()]
-    conn.close()
-
-    slots = [
-        f"{hour:02d}:00"
-        for hour in range(WORK_START, WORK_END)
-        if hour not in booked
-    ]
+@app.get("/availability", response_model=Availability)
+async def get_availability(date: str = Query(..., description="YYYY-MM-DD")):
+    try:
+        day = datetime.strptime(date, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(400, "صيغة التاريخ غير مفهومة، يرجى استخدام YYYY-MM-DD")
+
+    key = day.strftime("%Y-%m-%d")
+    version = data_version()
+    cached = AVAILABILITY_CACHE.get(key)
+    if cached and cached[1] == version and time.monotonic() < cached[2]:
+        return {"date": date, "available_slots": cached[0]}
+
+    day_start = to_epoch(day)
+    day_end = to_epoch(day + timedelta(days=1))
+
+    params = {
+        "work_start": WORK_START,
+        "work_end": WORK_END,
+        "day_start": day_start,
+        "day_end": day_end,
+    }
+
+    async with reader() as conn:
+        rows = await conn.execute_fetchall(SQL_FREE_SLOTS, params)
+    slots = [r[0] for r in rows]
+    # A write that committed while the query ran may or may not be in these
+    # rows, so only cache them if nothing has committed since.
+    if data_version() == version:
+        cache_availability(key, slots, version)
 
     return {
         "date": date,
@@ -130,127 +559,144 @@ def get_availability(date: str = Query(..., description="YYYY-MM-DD")):
     }
 
 # ---------- Create ----------
-@app.post("/appointments", status_code=status.HTTP_201_CREATED)
-def create_appointment(data: AppointmentCreate):
-    valid_date_str = parse_and_validate_date(data.appointment_date)
-    dt = datetime.strptime(valid_date_str, "%Y-%m-%d %H:%M")
-
-    if not (WORK_START <= dt.hour < WORK_END):
-        raise HTTPException(400, "خارج ساعات الدوام")
-
-    conn = get_db()
-
-    if not check_availability(conn, dt):
-        conn.close()
-        raise HTTPException(409, "الموعد غير متاح")
+@app.post("/appointments", status_code=status.HTTP_201_CREATED, response_model=Booking)
+async def create_appointment(data: AppointmentCreate):
+    ts = to_epoch(parse_and_validate_date(data.appointment_date))
+
+    params = (data.patient_name, data.age, data.service, ts)
+
+    def book():
+        with writer() as conn:
+            try:
+                with transaction(conn):
+                    new_id = conn.execute(SQL_INSERT_APPT, params).fetchone()[0]
+                    conn.execute(SQL_INDEX_NAME, (new_id, fold_name(data.patient_name)))
+            except sqlite3.IntegrityError as e:
+                raise booking_error(e, "الموعد غير متاح")
+        return new_id
+
+    new_id = await asyncio.to_thread(book)
+
+    return {"status": "booked", "id": new_id, "appointment_date": format_date(ts)}
+
+# ---------- Bulk Create ----------
+@app.post("/appointments/bulk", status_code=status.HTTP_201_CREATED, response_model=BulkBooking)
+async def create_appointments_bulk(data: List[AppointmentCreate] = Body(..., min_length=1)):
+    rows = [
+        (item.patient_name, item.age, item.service,
+         to_epoch(parse_and_validate_date(item.appointment_date)))
+        for item in data
+    ]
 
-    query = """
-        INSERT INTO appointments (patient_name, age, service, appointment_date)
-        VALUES (?, ?, ?, ?)
-        """
-    params = (data.patient_name, data.age, data.service, valid_date_str)
-    print(f"Query: {query}, Params: {params}")
+    def book_all():
+        # One transaction, so the whole batch costs a single fsync; any row
+        # breaking a booking rule or taking a used slot (in the table or
+        # earlier in the batch) rolls it all back.
+        try:
+            with writer() as conn, transaction(conn):
+                conn.executemany(SQL_INSERT_APPTS, rows)
+                conn.executemany(SQL_INDEX_BOOKED_NAME, [
+                    (fold_name(name), ts) for name, _, _, ts in rows
+                ])
+        except sqlite3.IntegrityError as e:
+            raise booking_error(e, "الموعد غير متاح")
 
-    conn.execute(query, params)
-    conn.commit()
-    conn.close()
+    await asyncio.to_thread(book_all)
 
-    return {"status": "booked", "appointment_date": valid_date_str}
+    return {
+        "status": "booked",
+        "count": len(rows),
+        "appointment_dates": [format_date(row[3]) for row in rows]
+    }
 
 # ---------- Get (Verify + Read) ----------
-@app.get("/appointments")
-def get_appointments(
+@app.get("/appointments", response_model=AppointmentList)
+async def get_appointments(
     patient_name: Optional[str] = None,
     age: Optional[int] = None
 ):
-    conn = get_db()
-    query = "SELECT id, appointment_date, service FROM appointments WHERE 1=1"
-    params = []
-
-    if patient_name:
-        query += " AND patient_name LIKE ?"
-        params.append(f"%{patient_name}%")
-
-    if age:
-        query += " AND age = ?"
-        params.append(age)
-
-    query += " ORDER BY appointment_date"
-
-    rows = conn.execute(query, params).fetchall()
-    conn.close()
+    if patient_name and age:
+        query, params = SQL_FIND_APPTS_BY_NAME_AGE, (name_query(patient_name), age)
+    elif patient_name:
+        query, params = SQL_FIND_APPTS_BY_NAME, (name_query(patient_name),)
+    elif age:
+        query, params = SQL_FIND_APPTS_BY_AGE, (age,)
+    else:
+        query, params = SQL_FIND_APPTS, ()
+
+    async with reader() as conn:
+        rows = await conn.execute_fetchall(query, params)
 
     return {
         "count": len(rows),
-        "appointments": [dict(row) for row in rows]
+        "appointments": [appointment_row(row, FOUND_APPT_KEYS) for row in rows]
     }
 
 # ---------- Get One ----------
-@app.get("/appointments/{appointment_id}")
-def get_appointment(appointment_id: int = Path(...)):
-    conn = get_db()
-    row = conn.execute(
-        "SELECT * FROM appointments WHERE id = ?",
-        (appointment_id,)
-    ).fetchone()
-    conn.close()
+@app.get("/appointments/{appointment_id}", response_model=Appointment)
+async def get_appointment(appointment_id: int = Path(...)):
+    async with reader() as conn:
+        async with conn.execute(SQL_GET_APPT, (appointment_id,)) as cursor:
+            row = await cursor.fetchone()
 
     if not row:
         raise HTTPException(404, "الموعد غير موجود")
 
-    return dict(row)
+    return appointment_row(row)
 
 # ---------- Update ----------
-@app.patch("/appointments/{appointment_id}")
-def update_appointment(
+@app.patch("/appointments/{appointment_id}", response_model=Rescheduled)
+async def update_appointment(
     appointment_id: int,
     data: AppointmentUpdate
 ):
-    valid_date_str = parse_and_validate_date(data.appointment_date)
-    new_dt = datetime.strptime(valid_date_str, "%Y-%m-%d %H:%M")
-
-    conn = get_db()
-
-    exists = conn.execute(
-        "SELECT id FROM appointments WHERE id = ?",
-        (appointment_id,)
-    ).fetchone()
+    new_ts = to_epoch(parse_and_validate_date(data.appointment_date))
 
-    if not exists:
-        conn.close()
-        raise HTTPException(404, "الموعد غير موجود")
+    def reschedule():
+        with writer() as conn:
+            try:
+                updated = conn.execute(
+                    SQL_RESCHEDULE_APPT, (new_ts, appointment_id)
+                ).fetchone()
+            except sqlite3.IntegrityError as e:
+                raise booking_error(e, "التوقيت الجديد غير متاح")
 
-    if not check_availability(conn, new_dt, appointment_id):
-        conn.close()
-        raise HTTPException(409, "التوقيت الجديد غير متاح")
+        if not updated:
+            raise HTTPException(404, "الموعد غير موجود")
 
-    conn.execute(
-        "UPDATE appointments SET appointment_date = ? WHERE id = ?",
-        (valid_date_str, appointment_id)
-    )
-    conn.commit()
-    conn.close()
+    await asyncio.to_thread(reschedule)
 
-    return {"status": "updated", "new_date": valid_date_str}
+    return {"status": "updated", "new_date": format_date(new_ts)}
 
 # ---------- Delete ----------
-@app.delete("/appointments/{appointment_id}")
-def delete_appointment(appointment_id: int):
-    conn = get_db()
-    cursor = conn.execute(
-        "DELETE FROM appointments WHERE id = ?",
-        (appointment_id,)
-    )
-
-    if cursor.rowcount == 0:
-        conn.close()
+@app.delete("/appointments/{appointment_id}", response_model=Cancelled)
+async def delete_appointment(appointment_id: int):
+    def cancel():
+        with writer() as conn, transaction(conn):
+            deleted = conn.execute(SQL_DELETE_APPT, (appointment_id,)).fetchone()
+            if deleted:
+                conn.execute(SQL_UNINDEX_NAME, (appointment_id,))
+        return deleted
+
+    deleted = await asyncio.to_thread(cancel)
+    if not deleted:
         raise HTTPException(404, "الموعد غير موجود")
 
-    conn.commit()
-    conn.close()
-
     return {"status": "cancelled"}
 
 if __name__ == "__main__":
+    import os
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Each worker process opens its own writer and reader connections in
+    # lifespan; WAL lets their reads run in parallel, and the availability
+    # cache checks data_version so it sees other workers' bookings. "auto"
+    # picks uvloop/httptools when installed (uvicorn[standard] skips uvloop
+    # on Windows) and falls back to asyncio/h11 otherwise.
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=os.cpu_count(),
+        loop="auto",
+        http="auto"
+    )
\ No newline at end of file
@@ -0,0 +1,426 @@
+import sqlite3
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+CLINIC_HOURS = (main.WORK_START, main.WORK_END)
+
+
+@pytest.fixture
+def app_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # Open the clinic around the clock so results do not depend on when the
+    # tests run.
+    monkeypatch.setattr(main, "WORK_START", 0)
+    monkeypatch.setattr(main, "WORK_END", 24)
+    main.AVAILABILITY_CACHE.clear()
+    return tmp_path
+
+
+@pytest.fixture
+def client(app_dir):
+    with TestClient(main.app) as c:
+        yield c
+
+
+def book(client, when: datetime, name: str = "Ahmad Ali"):
+    return client.post("/appointments", json={
+        "patient_name": name,
+        "age": 30,
+        "service": "cleaning",
+        "appointment_date": when.strftime("%Y-%m-%d %H:%M"),
+    })
+
+
+def next_hour() -> datetime:
+    return datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+
+
+def test_booking_keeps_requested_time(client):
+    when = next_hour()
+    r = book(client, when)
+    assert r.status_code == 201
+    assert r.json()["appointment_date"] == when.strftime("%Y-%m-%d %H:%M")
+
+
+def test_off_the_hour_time_is_rejected_not_moved(client):
+    r = book(client, next_hour() + timedelta(minutes=30))
+    assert r.status_code == 400
+    assert r.json()["detail"] == "المواعيد تبدأ على رأس الساعة فقط، مثل 10:00"
+    assert client.get("/appointments").json()["count"] == 0
+
+
+def test_start_of_current_hour_is_past(client):
+    this_hour = datetime.now().replace(minute=0, second=0, microsecond=0)
+    r = book(client, this_hour)
+    assert r.status_code == 400
+    assert r.json()["detail"].startswith("لا يمكن حجز موعد في الماضي")
+
+
+def test_future_time_in_current_hour_is_not_reported_as_past(client):
+    # e.g. 14:45 requested at 14:10: still in the future, so the only
+    # complaint is that it is not on the hour.
+    soon = datetime.now().replace(second=0, microsecond=0) + timedelta(minutes=2)
+    if soon.minute == 0:
+        soon += timedelta(minutes=1)
+    r = book(client, soon)
+    assert r.status_code == 400
+    assert not r.json()["detail"].startswith("لا يمكن حجز موعد في الماضي")
+
+
+def test_reschedule_into_the_past_is_rejected(client):
+    appointment_id = book(client, next_hour()).json()["id"]
+    past = next_hour() - timedelta(days=1)
+    r = client.patch(f"/appointments/{appointment_id}", json={
+        "appointment_date": past.strftime("%Y-%m-%d %H:%M"),
+    })
+    assert r.status_code == 400
+    assert r.json()["detail"].startswith("لا يمكن حجز موعد في الماضي")
+
+
+def write_legacy_db(app_dir, *rows):
+    # Schema and data as written before appointment_date became an epoch.
+    conn = sqlite3.connect(app_dir / main.DB_NAME)
+    conn.execute("""
+        CREATE TABLE appointments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_name TEXT NOT NULL,
+            age INTEGER NOT NULL,
+            service TEXT NOT NULL,
+            appointment_date TEXT NOT NULL
+        )
+    """)
+    conn.executemany("INSERT INTO appointments VALUES (?, ?, 25, 'x', ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def reschedule(client, appointment_id: int, when: datetime):
+    return client.patch(f"/appointments/{appointment_id}", json={
+        "appointment_date": when.strftime("%Y-%m-%d %H:%M"),
+    })
+
+
+def test_booking_a_taken_slot_is_a_conflict(client):
+    assert book(client, tomorrow_at(9)).status_code == 201
+    r = book(client, tomorrow_at(9), name="Sara")
+    assert r.status_code == 409
+    assert r.json()["detail"] == "الموعد غير متاح"
+    assert client.get("/appointments").json()["count"] == 1
+
+
+def test_rescheduling_into_a_taken_slot_is_a_conflict(client):
+    assert book(client, tomorrow_at(9)).status_code == 201
+    appointment_id = book(client, tomorrow_at(10), name="Sara").json()["id"]
+    r = reschedule(client, appointment_id, tomorrow_at(9))
+    assert r.status_code == 409
+    assert r.json()["detail"] == "التوقيت الجديد غير متاح"
+    assert client.get(f"/appointments/{appointment_id}").json()["appointment_date"] == (
+        tomorrow_at(10).strftime("%Y-%m-%d %H:%M")
+    )
+
+
+def test_rescheduling_a_missing_appointment_is_not_found(client):
+    r = reschedule(client, 999, tomorrow_at(9))
+    assert r.status_code == 404
+    assert r.json()["detail"] == "الموعد غير موجود"
+
+
+def test_booking_outside_working_hours_is_rejected(app_dir, monkeypatch):
+    start, end = CLINIC_HOURS
+    with TestClient(main.app) as client:
+        # Booked while the fixture keeps the clinic open around the clock.
+        appointment_id = book(client, tomorrow_at(end + 2)).json()["id"]
+
+    # Restarting with the real hours must rebuild the rules.
+    monkeypatch.setattr(main, "WORK_START", start)
+    monkeypatch.setattr(main, "WORK_END", end)
+    with TestClient(main.app) as client:
+        for hour in (start - 1, end):
+            r = book(client, tomorrow_at(hour))
+            assert r.status_code == 400
+            assert r.json()["detail"] == "خارج ساعات الدوام"
+
+            r = client.patch(f"/appointments/{appointment_id}", json={
+                "appointment_date": tomorrow_at(hour).strftime("%Y-%m-%d %H:%M"),
+            })
+            assert r.status_code == 400
+            assert r.json()["detail"] == "خارج ساعات الدوام"
+
+        assert book(client, tomorrow_at(start)).status_code == 201
+        assert book(client, tomorrow_at(end - 1)).status_code == 201
+
+
+def bulk(client, *whens: datetime):
+    return client.post("/appointments/bulk", json=[{
+        "patient_name": f"Patient {n}",
+        "age": 30,
+        "service": "cleaning",
+        "appointment_date": when.strftime("%Y-%m-%d %H:%M"),
+    } for n, when in enumerate(whens)])
+
+
+def test_bulk_booking_books_every_slot(client):
+    slots = [tomorrow_at(9), tomorrow_at(10)]
+    r = bulk(client, *slots)
+    assert r.status_code == 201
+    assert r.json() == {
+        "status": "booked",
+        "count": 2,
+        "appointment_dates": [slot.strftime("%Y-%m-%d %H:%M") for slot in slots],
+    }
+    assert find_by_name(client, "patient") == 2
+
+
+def test_bulk_clash_inside_the_batch_books_nothing(client):
+    r = bulk(client, tomorrow_at(9), tomorrow_at(10), tomorrow_at(9))
+    assert r.status_code == 409
+    assert client.get("/appointments").json()["count"] == 0
+    assert find_by_name(client, "patient") == 0
+
+
+def test_bulk_clash_with_a_booked_slot_books_nothing(client):
+    assert book(client, tomorrow_at(10)).status_code == 201
+    r = bulk(client, tomorrow_at(9), tomorrow_at(10), tomorrow_at(11))
+    assert r.status_code == 409
+    assert client.get("/appointments").json()["count"] == 1
+
+
+def test_bulk_rule_violation_mid_batch_books_nothing(client):
+    past = tomorrow_at(9) - timedelta(days=2)
+    r = bulk(client, tomorrow_at(9), past, tomorrow_at(11))
+    assert r.status_code == 400
+    assert r.json()["detail"].startswith("لا يمكن حجز موعد في الماضي")
+    assert client.get("/appointments").json()["count"] == 0
+
+
+def test_bulk_rejects_an_empty_batch(client):
+    assert client.post("/appointments/bulk", json=[]).status_code == 422
+
+
+def test_legacy_text_dates_are_migrated(app_dir):
+    write_legacy_db(
+        app_dir, (7, "Sara", "2030-01-05 10:30"), (8, "Omar", "2020-01-05 09:00")
+    )
+
+    with TestClient(main.app) as client:
+        r = client.get("/appointments/7")
+        assert r.status_code == 200
+        assert r.json()["appointment_date"] == "2030-01-05 10:00"
+        assert client.get("/appointments/8").json()["appointment_date"] == "2020-01-05 09:00"
+
+        slots = client.get("/availability", params={"date": "2030-01-05"}).json()["available_slots"]
+        assert "10:00" not in slots
+        assert book(client, datetime(2030, 1, 5, 10)).status_code == 409
+
+        new_id = book(client, next_hour()).json()["id"]
+        assert new_id > 8
+
+
+def test_legacy_rows_sharing_a_slot_are_set_aside(app_dir, caplog):
+    write_legacy_db(
+        app_dir,
+        (3, "Sara", "2030-01-05 10:00"),
+        (4, "Omar", "2030-01-05 10:45"),
+        (5, "Lina", "2030-01-05 10:00"),
+    )
+
+    with TestClient(main.app) as client:
+        assert client.get("/appointments/3").json()["patient_name"] == "Sara"
+        assert client.get("/appointments/4").status_code == 404
+        assert client.get("/appointments/5").status_code == 404
+    assert "[4, 5]" in caplog.text
+
+    conn = sqlite3.connect(app_dir / main.DB_NAME)
+    unmigrated = conn.execute(
+        "SELECT id, appointment_date FROM appointments_unmigrated ORDER BY id"
+    ).fetchall()
+    conn.close()
+    assert unmigrated == [(4, "2030-01-05 10:45"), (5, "2030-01-05 10:00")]
+
+
+def test_rows_from_before_the_name_index_are_searchable(app_dir):
+    # An epoch-dated table written before appointments_fts existed.
+    conn = sqlite3.connect(app_dir / main.DB_NAME)
+    conn.execute("""
+        CREATE TABLE appointments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_name TEXT NOT NULL,
+            age INTEGER NOT NULL,
+            service TEXT NOT NULL,
+            appointment_date INTEGER NOT NULL
+        )
+    """)
+    conn.execute("INSERT INTO appointments VALUES (1, 'Sara', 25, 'x', 1893830400)")
+    conn.commit()
+    conn.close()
+
+    for _ in range(2):  # a restart must not index the rows twice
+        with TestClient(main.app) as client:
+            r = client.get("/appointments", params={"patient_name": "sara"})
+            assert r.json()["count"] == 1
+
+
+def book_from_other_worker(app_dir, when: datetime):
+    # A plain connection, without the app's fold_name function.
+    conn = sqlite3.connect(app_dir / main.DB_NAME)
+    conn.execute(
+        "INSERT INTO appointments (patient_name, age, service, appointment_date) VALUES (?, ?, ?, ?)",
+        ("Other", 30, "x", main.to_epoch(when)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def find_by_name(client, name: str):
+    return client.get("/appointments", params={"patient_name": name}).json()["count"]
+
+
+def test_name_search_ignores_harakat(client):
+    assert book(client, next_hour(), name="مُحَمَّد علي").status_code == 201
+    assert find_by_name(client, "محمد") == 1
+    assert find_by_name(client, "مُحَمَّد") == 1
+
+
+def test_cancelled_appointment_leaves_name_search(client):
+    appointment_id = book(client, next_hour(), name="Sara").json()["id"]
+    assert find_by_name(client, "sara") == 1
+    assert client.delete(f"/appointments/{appointment_id}").status_code == 200
+    assert find_by_name(client, "sara") == 0
+
+
+def test_other_writers_rows_are_indexed_on_restart(app_dir):
+    with TestClient(main.app) as client:
+        book(client, next_hour(), name="Sara")
+        gone = book(client, next_hour() + timedelta(hours=1), name="Salma").json()["id"]
+
+    book_from_other_worker(app_dir, next_hour() + timedelta(hours=2))
+    conn = sqlite3.connect(app_dir / main.DB_NAME)
+    conn.execute("DELETE FROM appointments WHERE id = ?", (gone,))
+    conn.commit()
+    conn.close()
+
+    with TestClient(main.app) as client:
+        assert find_by_name(client, "other") == 1
+        assert find_by_name(client, "sara") == 1
+
+    conn = sqlite3.connect(app_dir / main.DB_NAME)
+    indexed = conn.execute("SELECT rowid FROM appointments_fts ORDER BY rowid").fetchall()
+    ids = conn.execute("SELECT id FROM appointments ORDER BY id").fetchall()
+    conn.close()
+    assert indexed == ids
+
+
+def tomorrow_at(hour: int) -> datetime:
+    day = datetime.now() + timedelta(days=1)
+    return datetime(day.year, day.month, day.day, hour)
+
+
+def free_slots(client, day: datetime):
+    params = {"date": day.strftime("%Y-%m-%d")}
+    return client.get("/availability", params=params).json()["available_slots"]
+
+
+@pytest.fixture
+def new_york_time(monkeypatch):
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_availability_on_a_dst_change_day(new_york_time, client):
+    # Clocks go forward from 02:00 to 03:00 that morning.
+    day = datetime(2030, 3, 10)
+    assert book(client, day.replace(hour=10)).status_code == 201
+    slots = free_slots(client, day)
+    assert "10:00" not in slots
+    assert "09:00" in slots
+
+
+def test_cached_availability_sees_other_workers_bookings(client, app_dir):
+    slot = tomorrow_at(9)
+    assert "09:00" in free_slots(client, slot)
+    book_from_other_worker(app_dir, slot)
+    assert "09:00" not in free_slots(client, slot)
+
+
+def test_booking_during_availability_query_is_not_cached(client, app_dir, monkeypatch):
+    slot = tomorrow_at(9)
+    original_reader = main.reader
+
+    @asynccontextmanager
+    async def racing_reader():
+        async with original_reader() as conn:
+            yield conn
+        # A booking commits after the slot query ran but before its result
+        # is stored.
+        book_from_other_worker(app_dir, slot)
+
+    monkeypatch.setattr(main, "reader", racing_reader)
+    assert "09:00" in free_slots(client, slot)
+    monkeypatch.setattr(main, "reader", original_reader)
+
+    assert "09:00" not in free_slots(client, slot)
+
+
+def test_availability_cache_is_bounded(client, monkeypatch):
+    monkeypatch.setattr(main, "AVAILABILITY_CACHE_SIZE", 3)
+    days = [tomorrow_at(9) + timedelta(days=n) for n in range(5)]
+    for day in days:
+        free_slots(client, day)
+    assert list(main.AVAILABILITY_CACHE) == [d.strftime("%Y-%m-%d") for d in days[-3:]]
+
+
+def test_availability_cache_drops_stale_entries(client):
+    free_slots(client, tomorrow_at(9))
+    assert book(client, tomorrow_at(9)).status_code == 201
+    later = tomorrow_at(9) + timedelta(days=1)
+    free_slots(client, later)
+    assert list(main.AVAILABILITY_CACHE) == [later.strftime("%Y-%m-%d")]
+
+
+def test_full_listing_is_streamed_page_by_page(client, monkeypatch):
+    monkeypatch.setattr(main, "STREAM_BATCH", 2)
+    slots = [tomorrow_at(hour) for hour in range(8, 13)]
+    for slot in reversed(slots):
+        assert book(client, slot).status_code == 201
+
+    body = client.get("/").json()
+    assert body["count"] == 5
+    assert [a["appointment_date"] for a in body["appointments"]] == [
+        slot.strftime("%Y-%m-%d %H:%M") for slot in slots
+    ]
+    assert main.READERS.qsize() == main.READ_POOL_SIZE
+
+
+def test_full_listing_of_empty_table(client):
+    assert client.get("/").json() == {"appointments": [], "count": 0}
+
+
+def test_full_listing_failure_is_a_500_not_an_empty_200(app_dir, monkeypatch):
+    def broken(ts):
+        raise ValueError("bad date")
+
+    with TestClient(main.app, raise_server_exceptions=False) as client:
+        assert book(client, next_hour()).status_code == 201
+        monkeypatch.setattr(main, "format_date", broken)
+        assert client.get("/").status_code == 500
+
+
+def test_patient_name_is_stored_stripped(client):
+    when = next_hour()
+    r = book(client, when, name="  Sara  ")
+    assert r.status_code == 201
+    assert client.get(f"/appointments/{r.json()['id']}").json()["patient_name"] == "Sara"
+
+
+def test_too_short_patient_name_is_rejected(client):
+    assert book(client, next_hour(), name=" S ").status_code == 422